@@ -1,19 +1,23 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, stream_with_context, abort
 from flask_sqlalchemy import SQLAlchemy
-from users import db, User, create_initial_admin
+from sqlalchemy import func, delete
+from users import db, User, create_initial_admin, hash_many, hash_password, verify_password
 from library import Library
+from attendance import VISITOR_TYPE_STR
 from datetime import datetime, date, timedelta
 import os
 from functools import wraps
 from flask_migrate import Migrate  # type: ignore # Added for migrations
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 import csv
-from io import TextIOWrapper
+from io import TextIOWrapper, StringIO
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Replace with a secure key in production
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///library.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db.init_app(app)
@@ -21,6 +25,12 @@ db.init_app(app)
 # Initialize Flask-Migrate
 migrate = Migrate(app, db)  # Added for migrations
 
+# Rate limiting keeps login attempts from tying up workers on password hashing
+limiter = Limiter(get_remote_address, app=app, storage_uri='memory://')
+
+# Compared against for unknown usernames so failed logins take the same time
+_DUMMY_PASSWORD_HASH = hash_password('not-a-real-password')
+
 with app.app_context():
     db.create_all()
     create_initial_admin(db)
@@ -28,6 +38,10 @@ with app.app_context():
 # Initialize the main Library object
 the_library = Library()
 
+# User listings are paged by id so deep pages cost the same as the first
+USERS_PAGE_SIZE = 50
+MAX_USERS_PAGE_SIZE = 200
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -46,6 +60,51 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _stream_csv(header, rows):
+    """Yield CSV text row by row so exports never hold the whole file in memory."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _csv_columns(header):
+    """Map each CSV header name to its column position."""
+    return {name: i for i, name in enumerate(header)}
+
+def _csv_field(row, index, default=None):
+    """Return the value at a column position, or default if the column is absent."""
+    if index is None or index >= len(row):
+        return default
+    return row[index]
+
+def _user_exists_by_username(username):
+    """Check for a username without loading the whole user row."""
+    return db.session.query(User.id).filter_by(username=username).scalar() is not None
+
+def _user_exists_by_student_id(student_id):
+    """Check for a student ID without loading the whole user row."""
+    return db.session.query(User.id).filter_by(student_id=student_id).scalar() is not None
+
+def _user_page():
+    """Fetch one keyset page of users for listing views.
+
+    Reads ?after=<last user id>&limit=<n> and returns the page plus the id
+    to pass as `after` for the next page (None on the last page).
+    """
+    after = request.args.get('after', 0, type=int)
+    limit = max(1, min(request.args.get('limit', USERS_PAGE_SIZE, type=int), MAX_USERS_PAGE_SIZE))
+    users = User.query.filter(User.id > after).order_by(User.id).limit(limit + 1).all()
+    if len(users) > limit:
+        return users[:limit], users[limit - 1].id
+    return users, None
+
 # Protect main features (books, members, attendance, borrow, return)
 @app.route('/')
 @login_required
@@ -112,8 +171,8 @@ def borrow():
         else:
             flash('Failed to borrow book. Check member/book availability.', 'danger')
         return redirect(url_for('books'))
-    members = the_library.list_all_members()
-    books = the_library.list_available_books()
+    members = the_library.list_member_choices()
+    books = the_library.list_book_choices(available_only=True)
     return render_template('borrow.html', members=members, books=books)
 
 @app.route('/return', methods=['GET', 'POST'])
@@ -127,8 +186,8 @@ def return_book():
         else:
             flash('Failed to return book.', 'danger')
         return redirect(url_for('books'))
-    members = the_library.list_all_members()
-    books = the_library.list_all_books()
+    members = the_library.list_member_choices()
+    books = the_library.list_book_choices()
     return render_template('return.html', members=members, books=books)
 
 # --- Attendance Management ---
@@ -173,13 +232,26 @@ def check_out():
         flash('Check-out failed. Not found or already checked out.', 'danger')
     return redirect(url_for('attendance'))
 
+def _login_username_key():
+    """Rate-limit key for the submitted username, kept apart from per-IP keys."""
+    return 'login-user:' + request.form.get('username', '')
+
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit('5/minute', methods=['POST'])
+@limiter.limit('5/minute', methods=['POST'], key_func=_login_username_key)
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        if user:
+            password_ok = user.check_password(password)
+            if password_ok and db.session.is_modified(user):
+                db.session.commit()  # Save the hash check_password upgraded
+        else:
+            verify_password(_DUMMY_PASSWORD_HASH, password)
+            password_ok = False
+        if password_ok:
             if user.role != 'admin':
                 flash('Only admins are allowed to log in.', 'danger')
                 return render_template('login.html')
@@ -201,8 +273,8 @@ def logout():
 @app.route('/users')
 @admin_required
 def users():
-    user_list = User.query.all()
-    return render_template('users.html', users=user_list)
+    user_list, next_after = _user_page()
+    return render_template('users.html', users=user_list, next_after=next_after)
 
 @app.route('/add_user', methods=['GET', 'POST'])
 @admin_required
@@ -214,9 +286,9 @@ def add_user():
         student_id = request.form.get('student_id')
         department = request.form.get('department')
         year = request.form.get('year')
-        if User.query.filter_by(username=username).first():
+        if _user_exists_by_username(username):
             flash('Username already exists.', 'danger')
-        elif role == 'student' and student_id and User.query.filter_by(student_id=student_id).first():
+        elif role == 'student' and student_id and _user_exists_by_student_id(student_id):
             flash('Student ID already registered.', 'danger')
         else:
             new_user = User(username=username, role=role)
@@ -234,11 +306,12 @@ def add_user():
 @app.route('/delete_user/<int:user_id>', methods=['POST'])
 @admin_required
 def delete_user(user_id):
-    user = User.query.get_or_404(user_id)
-    if user.username == session.get('username'):
+    if user_id == session.get('user_id'):
         flash('You cannot delete your own account.', 'danger')
     else:
-        db.session.delete(user)
+        deleted = db.session.execute(delete(User).where(User.id == user_id)).rowcount
+        if not deleted:
+            abort(404)
         db.session.commit()
         flash('User deleted successfully.', 'success')
     return redirect(url_for('users'))
@@ -258,26 +331,47 @@ def import_students():
             flash('Please upload a valid CSV file.', 'danger')
             return render_template('import_students.html', results=results)
         stream = TextIOWrapper(file.stream, encoding='utf-8')
-        reader = csv.DictReader(stream)
+        reader = csv.reader(stream)
+        columns = _csv_columns(next(reader, []))
+        u_i, p_i, s_i = columns.get('username'), columns.get('password'), columns.get('student_id')
+        d_i, y_i = columns.get('department'), columns.get('year')
+        existing_usernames = {u for (u,) in db.session.query(User.username).all()}
+        existing_student_ids = {s for (s,) in db.session.query(User.student_id).filter(User.student_id.isnot(None)).all()}
+        new_users = []
+        passwords = []
         for row in reader:
-            username = row.get('username')
-            password = row.get('password')
-            student_id = row.get('student_id')
-            department = row.get('department')
-            year = row.get('year')
+            if not row:
+                continue
+            username = _csv_field(row, u_i)
+            password = _csv_field(row, p_i)
+            student_id = _csv_field(row, s_i)
+            department = _csv_field(row, d_i)
+            year = _csv_field(row, y_i)
             if not username or not password or not student_id:
                 results.append({'username': username, 'student_id': student_id, 'status': 'Missing required fields'})
                 continue
-            if User.query.filter_by(username=username).first():
+            if username in existing_usernames:
                 results.append({'username': username, 'student_id': student_id, 'status': 'Username exists'})
                 continue
-            if User.query.filter_by(student_id=student_id).first():
+            if student_id in existing_student_ids:
                 results.append({'username': username, 'student_id': student_id, 'status': 'Student ID exists'})
                 continue
-            new_user = User(username=username, role='student', student_id=student_id, department=department, year=year)
-            new_user.set_password(password)
-            db.session.add(new_user)
+            existing_usernames.add(username)
+            existing_student_ids.add(student_id)
+            passwords.append(password)
+            new_users.append({
+                'username': username,
+                'role': 'student',
+                'student_id': student_id,
+                'department': department,
+                'year': year
+            })
             results.append({'username': username, 'student_id': student_id, 'status': 'Imported'})
+        if new_users:
+            # Hash after the loop so the whole batch can be spread over CPU cores
+            for new_user, password_hash in zip(new_users, hash_many(passwords)):
+                new_user['password_hash'] = password_hash
+            db.session.execute(User.__table__.insert(), new_users)
         db.session.commit()
         flash('Import completed.', 'success')
     return render_template('import_students.html', results=results)
@@ -292,14 +386,19 @@ def import_books():
             flash('Please upload a valid CSV file.', 'danger')
             return render_template('import_books.html', results=results)
         stream = TextIOWrapper(file.stream, encoding='utf-8')
-        reader = csv.DictReader(stream)
+        reader = csv.reader(stream)
+        columns = _csv_columns(next(reader, []))
+        b_i, t_i, a_i, i_i = columns.get('book_id'), columns.get('title'), columns.get('author'), columns.get('isbn')
+        c_i, n_i = columns.get('category'), columns.get('copies')
         for row in reader:
-            book_id = row.get('book_id')
-            title = row.get('title')
-            author = row.get('author')
-            isbn = row.get('isbn')
-            category = row.get('category', 'General')
-            copies = row.get('copies', 1)
+            if not row:
+                continue
+            book_id = _csv_field(row, b_i)
+            title = _csv_field(row, t_i)
+            author = _csv_field(row, a_i)
+            isbn = _csv_field(row, i_i)
+            category = _csv_field(row, c_i, 'General')
+            copies = _csv_field(row, n_i, 1)
             try:
                 copies = int(copies)
             except Exception:
@@ -323,26 +422,29 @@ def admin_data_management():
 @admin_required
 def admin_users_data():
     """Admin view of all users data."""
-    users = User.query.all()
+    users, next_after = _user_page()
+    role_counts = dict(db.session.query(User.role, func.count(User.id)).group_by(User.role).all())
     user_stats = {
-        'total': len(users),
-        'admins': len([u for u in users if u.role == 'admin']),
-        'students': len([u for u in users if u.role == 'student']),
-        'staff': len([u for u in users if u.role == 'user'])
+        'total': sum(role_counts.values()),
+        'admins': role_counts.get('admin', 0),
+        'students': role_counts.get('student', 0),
+        'staff': role_counts.get('user', 0)
     }
-    return render_template('admin/users_data.html', users=users, stats=user_stats)
+    return render_template('admin/users_data.html', users=users, stats=user_stats, next_after=next_after)
 
 @app.route('/admin/books_data')
 @admin_required
 def admin_books_data():
     """Admin view of all books data."""
     books = the_library.list_all_books()
+    total_copies = the_library.total_copies
+    available_copies = the_library.total_available_copies
     book_stats = {
         'total_books': len(books),
-        'total_copies': sum(book.total_copies for book in books),
-        'available_copies': sum(book.available_copies for book in books),
-        'borrowed_copies': sum(book.total_copies - book.available_copies for book in books),
-        'categories': len(set(book.category for book in books))
+        'total_copies': total_copies,
+        'available_copies': available_copies,
+        'borrowed_copies': total_copies - available_copies,
+        'categories': len({book.category for book in books})
     }
     return render_template('admin/books_data.html', books=books, stats=book_stats)
 
@@ -351,11 +453,17 @@ def admin_books_data():
 def admin_members_data():
     """Admin view of all members data."""
     members = the_library.list_all_members()
+    premium_members = regular_members = 0
+    for member in members:
+        if member.membership_type == 'Premium':
+            premium_members += 1
+        elif member.membership_type == 'Regular':
+            regular_members += 1
     member_stats = {
         'total_members': len(members),
-        'active_members': len([m for m in members if m.borrowed_books]),
-        'premium_members': len([m for m in members if m.membership_type == 'Premium']),
-        'regular_members': len([m for m in members if m.membership_type == 'Regular'])
+        'active_members': the_library.active_member_count,
+        'premium_members': premium_members,
+        'regular_members': regular_members
     }
     return render_template('admin/members_data.html', members=members, stats=member_stats)
 
@@ -365,17 +473,12 @@ def admin_attendance_data():
     """Admin view of attendance data."""
     today = date.today()
     current_visitors = the_library.get_current_visitors()
-    daily_stats = the_library.get_daily_attendance_stats(today)
     
     # Get attendance history for the last 7 days
-    attendance_history = []
-    for i in range(7):
-        check_date = today - timedelta(days=i)
-        stats = the_library.get_daily_attendance_stats(check_date)
-        attendance_history.append({
-            'date': check_date,
-            'stats': stats
-        })
+    history_dates = [today - timedelta(days=i) for i in range(7)]
+    history_stats = the_library.get_attendance_stats_for_dates(history_dates)
+    daily_stats = history_stats[today]
+    attendance_history = [{'date': d, 'stats': history_stats[d]} for d in history_dates]
     
     return render_template('admin/attendance_data.html', 
                          current_visitors=current_visitors,
@@ -400,42 +503,34 @@ def admin_overdue_data():
 @admin_required
 def admin_export_data(data_type):
     """Export data as CSV."""
-    from io import StringIO
-    import csv
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    
     if data_type == 'users':
-        users = User.query.all()
-        writer.writerow(['ID', 'Username', 'Role', 'Student ID', 'Department', 'Year'])
-        for user in users:
-            writer.writerow([user.id, user.username, user.role, user.student_id, user.department, user.year])
+        header = ['ID', 'Username', 'Role', 'Student ID', 'Department', 'Year']
+        rows = ([user.id, user.username, user.role, user.student_id, user.department, user.year]
+                for user in User.query.order_by(User.id).yield_per(1000))
     
     elif data_type == 'books':
-        books = the_library.list_all_books()
-        writer.writerow(['Book ID', 'Title', 'Author', 'ISBN', 'Category', 'Total Copies', 'Available Copies'])
-        for book in books:
-            writer.writerow([book.book_id, book.title, book.author, book.isbn, book.category, book.total_copies, book.available_copies])
+        header = ['Book ID', 'Title', 'Author', 'ISBN', 'Category', 'Total Copies', 'Available Copies']
+        rows = ([book.book_id, book.title, book.author, book.isbn, book.category, book.total_copies, book.available_copies]
+                for book in the_library.list_all_books())
     
     elif data_type == 'members':
-        members = the_library.list_all_members()
-        writer.writerow(['Member ID', 'Name', 'Email', 'Phone', 'Membership Type', 'Join Date', 'Borrowed Books'])
-        for member in members:
-            writer.writerow([member.member_id, member.name, member.email, member.phone, member.membership_type, member.join_date, len(member.borrowed_books)])
+        header = ['Member ID', 'Name', 'Email', 'Phone', 'Membership Type', 'Join Date', 'Borrowed Books']
+        rows = ([member.member_id, member.name, member.email, member.phone, member.membership_type, member.join_date, len(member.borrowed_books)]
+                for member in the_library.list_all_members())
     
     elif data_type == 'attendance':
         # Export today's attendance
         today = date.today()
-        attendance_records = the_library.attendance_tracker.get_daily_attendance(today)
-        writer.writerow(['Visitor ID', 'Name', 'Type', 'Entry Time', 'Exit Time', 'Duration (min)', 'Purpose'])
-        for record in attendance_records:
-            writer.writerow([record.visitor_id, record.name, record.visitor_type.value, 
-                           record.entry_time, record.exit_time, record.get_duration(), record.purpose])
+        header = ['Visitor ID', 'Name', 'Type', 'Entry Time', 'Exit Time', 'Duration (min)', 'Purpose']
+        rows = ([record.visitor_id, record.name, VISITOR_TYPE_STR[record.visitor_type],
+                 record.entry_time, record.exit_time, record.get_duration(), record.purpose]
+                for record in the_library.attendance_tracker.get_daily_attendance(today))
+    
+    else:
+        header, rows = None, ()
     
-    output.seek(0)
     return Response(
-        output.getvalue(),
+        stream_with_context(_stream_csv(header, rows)),
         mimetype='text/csv',
         headers={'Content-Disposition': f'attachment; filename={data_type}_data_{date.today()}.csv'}
     )
@@ -458,15 +553,13 @@ def admin_search_data():
             results['users'] = users
         
         if search_type in ['all', 'books']:
-            books = the_library.search_books(search_query, 'title')
-            books.extend(the_library.search_books(search_query, 'author'))
-            books.extend(the_library.search_books(search_query, 'isbn'))
-            results['books'] = list(set(books))  # Remove duplicates
+            results['books'] = the_library.search_books_multi(search_query, ('title', 'author', 'isbn'))
         
         if search_type in ['all', 'members']:
+            query_lower = search_query.lower()
             members = [m for m in the_library.list_all_members() 
-                      if search_query.lower() in m.name.lower() or 
-                         search_query.lower() in m.email.lower() or
+                      if query_lower in m.name.lower() or 
+                         query_lower in m.email.lower() or
                          search_query in m.member_id]
             results['members'] = members
     
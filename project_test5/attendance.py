@@ -1,24 +1,71 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional
 from enum import Enum
+from operator import itemgetter
+from sqlalchemy import func, true
+from sqlalchemy.exc import IntegrityError
+from users import db
 
 class VisitorType(Enum):
     MEMBER = "member"
     VISITOR = "visitor"
     STAFF = "staff"
 
-class AttendanceRecord:
+_EMPTY_DAILY_STATS = {
+    'total_visitors': 0,
+    'members': 0,
+    'visitors': 0,
+    'staff': 0
+}
+
+_by_count = itemgetter(1)
+
+# Enum .value goes through a descriptor on every access; look the strings up once
+VISITOR_TYPE_STR = {t: t.value for t in VisitorType}
+_TYPE_PLURAL = {
+    VisitorType.MEMBER: 'members',
+    VisitorType.VISITOR: 'visitors',
+    VisitorType.STAFF: 'staff'
+}
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class AttendanceRecord(db.Model):
     """Represents a single attendance record."""
+    id = db.Column(db.Integer, primary_key=True)
+    visitor_id = db.Column(db.String(50), nullable=False, index=True)
+    name = db.Column(db.String(120), nullable=False)
+    visitor_type = db.Column(db.Enum(VisitorType), nullable=False)
+    entry_time = db.Column(db.DateTime, nullable=False)
+    exit_time = db.Column(db.DateTime, nullable=True)
+    purpose = db.Column(db.String(200), nullable=False, default='')  # Purpose of visit for non-members
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
     
-    def __init__(self, visitor_id: str, name: str, visitor_type: VisitorType, 
-                 entry_time: datetime = None):
-        self.visitor_id = visitor_id
-        self.name = name
-        self.visitor_type = visitor_type
-        self.entry_time = entry_time or datetime.now()
-        self.exit_time: Optional[datetime] = None
-        self.purpose = ""  # Purpose of visit for non-members
-        self.is_active = True
+    __table_args__ = (
+        # Partial indexes cover only people still in the library; queries must
+        # filter on _IS_ACTIVE (not a bound parameter) for the planner to use them.
+        # The unique one also stops two workers checking the same visitor in twice.
+        # Other backends (MySQL) have no partial indexes and would make visitor_id
+        # unique across all visits, so there it is skipped and check_in's presence
+        # check is the only guard.
+        db.Index('ix_attendance_active', 'visitor_id', unique=True,
+                 sqlite_where=is_active == true(),
+                 postgresql_where=is_active == true()).ddl_if(dialect=('sqlite', 'postgresql')),
+        db.Index('ix_attendance_current', 'entry_time',
+                 sqlite_where=is_active == true(), postgresql_where=is_active == true()),
+        # Serves date-range scans and the per-day GROUP BY in get_stats_for_dates
+        db.Index('ix_attendance_entry_type', 'entry_time', 'visitor_type'),
+    )
+    
+    def __init__(self, visitor_id: str, name: str, visitor_type: VisitorType,
+                 entry_time: datetime = None, purpose: str = ""):
+        super().__init__(
+            visitor_id=visitor_id,
+            name=name,
+            visitor_type=visitor_type,
+            entry_time=entry_time or datetime.now(),
+            purpose=purpose,
+            is_active=True
+        )
     
     def check_out(self, exit_time: datetime = None):
         """Mark the visitor as checked out."""
@@ -35,86 +82,103 @@ class AttendanceRecord:
         status = "Active" if self.is_active else "Checked Out"
         return f"AttendanceRecord(ID: {self.visitor_id}, Name: {self.name}, Type: {self.visitor_type.value}, Status: {status})"
 
+_IS_ACTIVE = AttendanceRecord.is_active == true()
+
 class AttendanceTracker:
-    """Manages attendance and visitor tracking."""
+    """Manages attendance and visitor tracking.
     
-    def __init__(self):
-        self.attendance_records: List[AttendanceRecord] = []
-        self.daily_stats = {}  # date -> stats dict
+    Records are stored in the database, so every worker process sees the
+    same visitors and nothing is lost on restart. All methods need an
+    application context.
+    """
     
-    def check_in(self, visitor_id: str, name: str, visitor_type: VisitorType, 
+    def check_in(self, visitor_id: str, name: str, visitor_type: VisitorType,
                  purpose: str = "") -> bool:
         """Check in a visitor."""
         # Check if already checked in
         if self.is_currently_present(visitor_id):
             return False
         
-        record = AttendanceRecord(visitor_id, name, visitor_type)
-        record.purpose = purpose
-        self.attendance_records.append(record)
-        
-        # Update daily stats
-        today = date.today()
-        if today not in self.daily_stats:
-            self.daily_stats[today] = {
-                'total_visitors': 0,
-                'members': 0,
-                'visitors': 0,
-                'staff': 0
-            }
-        
-        self.daily_stats[today]['total_visitors'] += 1
-        self.daily_stats[today][visitor_type.value + 's'] += 1
-        
+        db.session.add(AttendanceRecord(visitor_id, name, visitor_type, purpose=purpose))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request checked the same visitor in first
+            db.session.rollback()
+            return False
         return True
     
     def check_out(self, visitor_id: str) -> bool:
         """Check out a visitor."""
-        for record in reversed(self.attendance_records):
-            if record.visitor_id == visitor_id and record.is_active:
-                record.check_out()
-                return True
-        return False
+        updated = AttendanceRecord.query.filter(
+            AttendanceRecord.visitor_id == visitor_id, _IS_ACTIVE
+        ).update(
+            {'is_active': False, 'exit_time': datetime.now()}
+        )
+        db.session.commit()
+        return updated > 0
     
     def is_currently_present(self, visitor_id: str) -> bool:
         """Check if a visitor is currently in the library."""
-        for record in reversed(self.attendance_records):
-            if record.visitor_id == visitor_id and record.is_active:
-                return True
-        return False
+        return db.session.query(AttendanceRecord.id).filter(
+            AttendanceRecord.visitor_id == visitor_id, _IS_ACTIVE
+        ).first() is not None
     
     def get_current_visitors(self) -> List[AttendanceRecord]:
         """Get list of currently present visitors."""
-        return [record for record in self.attendance_records if record.is_active]
+        return AttendanceRecord.query.filter(_IS_ACTIVE).order_by(AttendanceRecord.entry_time).all()
+    
+    def _records_between(self, start_date: date, end_date: date):
+        """Query for records whose entry falls on any day from start_date to end_date."""
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        return AttendanceRecord.query.filter(
+            AttendanceRecord.entry_time >= start,
+            AttendanceRecord.entry_time < end
+        ).order_by(AttendanceRecord.entry_time)
     
     def get_daily_attendance(self, target_date: date = None) -> List[AttendanceRecord]:
         """Get attendance records for a specific date."""
         if target_date is None:
             target_date = date.today()
         
-        return [
-            record for record in self.attendance_records
-            if record.entry_time.date() == target_date
-        ]
+        return self._records_between(target_date, target_date).all()
     
     def get_visitor_history(self, visitor_id: str) -> List[AttendanceRecord]:
         """Get attendance history for a specific visitor."""
-        return [
-            record for record in self.attendance_records
-            if record.visitor_id == visitor_id
-        ]
+        return AttendanceRecord.query.filter_by(visitor_id=visitor_id).order_by(AttendanceRecord.entry_time).all()
     
     def get_daily_stats(self, target_date: date = None) -> Dict:
         """Get statistics for a specific date."""
         if target_date is None:
             target_date = date.today()
         
-        return self.daily_stats.get(target_date, {
-            'total_visitors': 0,
-            'members': 0,
-            'visitors': 0,
-            'staff': 0
-        })
+        return self.get_stats_for_dates([target_date])[target_date]
+    
+    def get_stats_for_dates(self, dates: List[date]) -> Dict[date, Dict]:
+        """Get statistics for several dates with a single GROUP BY query."""
+        if not dates:
+            return {}
+        
+        start = datetime.combine(min(dates), datetime.min.time())
+        end = datetime.combine(max(dates) + timedelta(days=1), datetime.min.time())
+        entry_day = func.date(AttendanceRecord.entry_time)
+        rows = db.session.query(
+            entry_day, AttendanceRecord.visitor_type, func.count(AttendanceRecord.id)
+        ).filter(
+            AttendanceRecord.entry_time >= start,
+            AttendanceRecord.entry_time < end
+        ).group_by(entry_day, AttendanceRecord.visitor_type).all()
+        
+        stats = {}
+        for day, visitor_type, count in rows:
+            # SQLite returns DATE() as text, other backends as a date
+            day_stats = stats.setdefault(date.fromisoformat(str(day)), dict(_EMPTY_DAILY_STATS))
+            day_stats['total_visitors'] += count
+            day_stats[_TYPE_PLURAL[visitor_type]] += count
+        
+        # Fresh dicts for empty days, so callers can't modify the shared template
+        return {d: stats[d] if d in stats else dict(_EMPTY_DAILY_STATS) for d in dates}
     
     def get_weekly_stats(self, week_start: date) -> Dict:
         """Get statistics for a week."""
@@ -126,9 +190,8 @@ class AttendanceTracker:
             'daily_breakdown': {}
         }
         
-        for i in range(7):
-            current_date = week_start + timedelta(days=i)
-            daily_stats = self.get_daily_stats(current_date)
+        week_dates = [week_start + timedelta(days=i) for i in range(7)]
+        for current_date, daily_stats in self.get_stats_for_dates(week_dates).items():
             weekly_stats['daily_breakdown'][current_date.strftime('%Y-%m-%d')] = daily_stats
             
             weekly_stats['total_visitors'] += daily_stats['total_visitors']
@@ -143,14 +206,15 @@ class AttendanceTracker:
         if target_date is None:
             target_date = date.today()
         
-        hourly_counts = {}
-        daily_records = self.get_daily_attendance(target_date)
-        
-        for record in daily_records:
-            hour = record.entry_time.hour
-            hourly_counts[hour] = hourly_counts.get(hour, 0) + 1
+        start = datetime.combine(target_date, datetime.min.time())
+        entry_hour = func.extract('hour', AttendanceRecord.entry_time)
+        rows = db.session.query(entry_hour, func.count(AttendanceRecord.id)).filter(
+            AttendanceRecord.entry_time >= start,
+            AttendanceRecord.entry_time < start + timedelta(days=1)
+        ).group_by(entry_hour).all()
+        hourly_counts = {int(hour): count for hour, count in rows}
         
-        peak_hour = max(hourly_counts.items(), key=lambda x: x[1]) if hourly_counts else (0, 0)
+        peak_hour = max(hourly_counts.items(), key=_by_count) if hourly_counts else (0, 0)
         
         return {
             'hourly_breakdown': hourly_counts,
@@ -162,19 +226,16 @@ class AttendanceTracker:
         """Export attendance report for a date range."""
         report = []
         
-        for record in self.attendance_records:
-            record_date = record.entry_time.date()
-            if start_date <= record_date <= end_date:
-                report.append({
-                    'visitor_id': record.visitor_id,
-                    'name': record.name,
-                    'type': record.visitor_type.value,
-                    'entry_time': record.entry_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'exit_time': record.exit_time.strftime('%Y-%m-%d %H:%M:%S') if record.exit_time else 'Still Present',
-                    'duration_minutes': record.get_duration(),
-                    'purpose': record.purpose
-                })
+        for record in self._records_between(start_date, end_date):
+            report.append({
+                'visitor_id': record.visitor_id,
+                'name': record.name,
+                'type': VISITOR_TYPE_STR[record.visitor_type],
+                'entry_time': record.entry_time.strftime(_TIMESTAMP_FORMAT),
+                'exit_time': record.exit_time.strftime(_TIMESTAMP_FORMAT) if record.exit_time else 'Still Present',
+                'duration_minutes': record.get_duration(),
+                'purpose': record.purpose
+            })
         
         return report
 
-from datetime import timedelta
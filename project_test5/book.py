@@ -4,6 +4,10 @@ from typing import Optional
 class Book:
     """Represents a book in the library system."""
     
+    __slots__ = ('book_id', 'title', 'author', 'isbn', 'category', 'total_copies',
+                 'available_copies', 'borrowed_by', 'on_availability_change',
+                 'title_lower', 'author_lower', 'category_lower')
+    
     def __init__(self, book_id: str, title: str, author: str, isbn: str, 
                  category: str = "General", copies: int = 1):
         self.book_id = book_id
@@ -14,6 +18,11 @@ class Book:
         self.total_copies = copies
         self.available_copies = copies
         self.borrowed_by = {}  # {member_id: borrow_date}
+        self.on_availability_change = None  # Optional callback(book_id, is_available)
+        # Lowercased once here so searches don't re-lowercase every book per query
+        self.title_lower = title.lower()
+        self.author_lower = author.lower()
+        self.category_lower = category.lower()
     
     def is_available(self) -> bool:
         """Check if the book is available for borrowing."""
@@ -24,6 +33,8 @@ class Book:
         if self.is_available():
             self.available_copies -= 1
             self.borrowed_by[member_id] = datetime.now()
+            if self.available_copies == 0 and self.on_availability_change:
+                self.on_availability_change(self.book_id, False)
             return True
         return False
     
@@ -32,6 +43,8 @@ class Book:
         if member_id in self.borrowed_by:
             self.available_copies += 1
             del self.borrowed_by[member_id]
+            if self.available_copies == 1 and self.on_availability_change:
+                self.on_availability_change(self.book_id, True)
             return True
         return False
     
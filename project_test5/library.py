@@ -1,10 +1,34 @@
+import bisect
+from collections import defaultdict, deque
+from itertools import islice
+from operator import attrgetter
 from datetime import datetime, timedelta, date
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple, Set, NamedTuple
 from book import Book
 from member import Member
 from notifications import NotificationService
 from attendance import AttendanceTracker, VisitorType
 
+# Book attribute compared against a lowercased query for each search field
+_SEARCH_ATTRS = {
+    'title': 'title_lower',
+    'author': 'author_lower',
+    'category': 'category_lower',
+    'isbn': 'isbn'
+}
+
+MAX_TRANSACTIONS = 100_000  # Oldest entries are dropped beyond this
+
+# Queries matching more than this share of the catalog are answered by a plain scan,
+# which is already in catalog order and skips building and sorting a large candidate set
+SEARCH_SCAN_FRACTION = 0.05
+
+class Transaction(NamedTuple):
+    """A transaction log entry as returned by get_transaction_history."""
+    timestamp: datetime
+    action: str
+    description: str
+
 class Library:
     """Main library management system."""
     
@@ -12,7 +36,27 @@ class Library:
         self.name = name
         self.books: Dict[str, Book] = {}  # book_id -> Book
         self.members: Dict[str, Member] = {}  # member_id -> Member
-        self.transactions = []  # Transaction history
+        self.transactions = deque(maxlen=MAX_TRANSACTIONS)  # (timestamp, action, description) tuples
+        self.available_book_ids: Dict[str, None] = {}  # Books with free copies; read back via _books_in_catalog_order
+        self.total_available_copies = 0
+        self.total_copies = 0
+        self.active_member_count = 0  # Members with at least one book out
+        
+        # Outstanding loans as (borrow_date, book_id, member_id), oldest first
+        self._active_loans: List[Tuple[datetime, str, str]] = []
+        self._loan_pos: Dict[Tuple[str, str], datetime] = {}  # (book_id, member_id) -> borrow_date
+        
+        # Search indexes, filled once per book in add_book
+        self._title_tokens: Dict[str, Set[str]] = defaultdict(set)  # token -> book_ids
+        self._author_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self._category_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self._book_seq: Dict[str, int] = {}  # book_id -> insertion order, to keep results in catalog order
+        self._next_seq = 0
+        
+        # Member emails for bulk mail; removal swaps the last entry into the freed slot
+        self._member_emails: List[str] = []
+        self._email_owners: List[str] = []  # member_id for each entry in _member_emails
+        self._email_index: Dict[str, int] = {}  # member_id -> position in _member_emails
         
         # Initialize notification service (to be configured later)
         self.notification_service: Optional[NotificationService] = None
@@ -28,7 +72,13 @@ class Library:
             return False
         
         book = Book(book_id, title, author, isbn, category, copies)
+        book.on_availability_change = self._on_availability_change
         self.books[book_id] = book
+        self.total_copies += copies
+        self.total_available_copies += copies
+        if book.is_available():
+            self.available_book_ids[book_id] = None
+        self._index_book(book)
         self._log_transaction("ADD_BOOK", f"Added book: {title}")
         return True
     
@@ -42,23 +92,112 @@ class Library:
             return False  # Can't remove borrowed books
         
         del self.books[book_id]
+        self.available_book_ids.pop(book_id, None)
+        self.total_copies -= book.total_copies
+        self.total_available_copies -= book.available_copies
+        self._unindex_book(book)
         self._log_transaction("REMOVE_BOOK", f"Removed book: {book.title}")
         return True
     
     def search_books(self, query: str, search_type: str = "title") -> List[Book]:
         """Search for books by title, author, or category."""
+        query = query.lower()
+        
+        if search_type == "isbn":
+            # ISBNs have no tokens to index, so any substring needs a full pass anyway
+            return [book for book in self.books.values() if query in book.isbn]
+        
+        indexes = {
+            "title": self._title_tokens,
+            "author": self._author_tokens,
+            "category": self._category_tokens,
+        }
+        if search_type not in indexes:
+            return []
+        token_index = indexes[search_type]
+        get_field = attrgetter(_SEARCH_ATTRS[search_type])
+        
+        candidates = self._token_candidates(token_index, query.split())
+        if candidates is None:
+            return [book for book in self.books.values() if query in get_field(book)]
+        
+        books = self.books
+        return self._books_in_catalog_order(
+            book_id for book_id in candidates if query in get_field(books[book_id])
+        )
+    
+    def _token_candidates(self, token_index: Dict[str, Set[str]],
+                          query_tokens: List[str]) -> Optional[Set[str]]:
+        """Get a superset of the book IDs matching every query token, or None to scan instead."""
+        limit = len(self.books) * SEARCH_SCAN_FRACTION
+        candidate_sets = []
+        for query_token in query_tokens:
+            # An exact hit is a cheap lower bound; if it is already broad, this token
+            # can't narrow the search and the final substring check covers it
+            if len(token_index.get(query_token, ())) > limit:
+                continue
+            # A whitespace-free query token can only occur inside a single field
+            # token, so the matching vocabulary entries give a superset of hits.
+            ids = set()
+            for token, book_ids in token_index.items():
+                if query_token in token:
+                    ids |= book_ids
+                    if len(ids) > limit:
+                        break
+            if not ids:
+                return set()
+            if len(ids) <= limit:
+                candidate_sets.append(ids)
+        
+        if not candidate_sets:
+            return None
+        candidate_sets.sort(key=len)
+        return candidate_sets[0].intersection(*candidate_sets[1:])
+    
+    def _books_in_catalog_order(self, book_ids) -> List[Book]:
+        """Resolve book IDs to books, ordered as they were added."""
+        return [self.books[book_id] for book_id in sorted(book_ids, key=self._book_seq.__getitem__)]
+    
+    def _index_book(self, book: Book):
+        """Add a book to the search indexes."""
+        book_id = book.book_id
+        for text, token_index in (
+            (book.title_lower, self._title_tokens),
+            (book.author_lower, self._author_tokens),
+            (book.category_lower, self._category_tokens),
+        ):
+            for token in text.split():
+                token_index[token].add(book_id)
+        self._book_seq[book_id] = self._next_seq
+        self._next_seq += 1
+    
+    def _unindex_book(self, book: Book):
+        """Remove a book from the search indexes."""
+        book_id = book.book_id
+        for text, token_index in (
+            (book.title_lower, self._title_tokens),
+            (book.author_lower, self._author_tokens),
+            (book.category_lower, self._category_tokens),
+        ):
+            for token in text.split():
+                token_index[token].discard(book_id)
+                if not token_index[token]:
+                    del token_index[token]
+        del self._book_seq[book_id]
+    
+    def search_books_multi(self, query: str,
+                           fields: tuple = ("title", "author", "isbn")) -> List[Book]:
+        """Search for books matching the query in any of the given fields."""
         results = []
         query = query.lower()
+        getters = [attrgetter(_SEARCH_ATTRS[field]) for field in fields]
         
+        # Each book is visited once, so a match on several fields is only added once
         for book in self.books.values():
-            if search_type == "title" and query in book.title.lower():
-                results.append(book)
-            elif search_type == "author" and query in book.author.lower():
-                results.append(book)
-            elif search_type == "category" and query in book.category.lower():
-                results.append(book)
-            elif search_type == "isbn" and query in book.isbn:
-                results.append(book)
+            for get_field in getters:
+                if query in get_field(book):
+                    results.append(book)
+                    break
         
         return results
     
@@ -72,7 +211,23 @@ class Library:
     
     def list_available_books(self) -> List[Book]:
         """Get all available books."""
-        return [book for book in self.books.values() if book.is_available()]
+        return self._books_in_catalog_order(self.available_book_ids)
+    
+    def list_book_choices(self, available_only: bool = False) -> List[Tuple[str, str, int]]:
+        """Get (book_id, title, available_copies) tuples for selection lists."""
+        if available_only:
+            # Returned books rejoin the index at the end, so restore catalog order
+            books = self._books_in_catalog_order(self.available_book_ids)
+        else:
+            books = self.books.values()
+        return [(book.book_id, book.title, book.available_copies) for book in books]
+    
+    def _on_availability_change(self, book_id: str, is_available: bool):
+        """Keep the available-books index in step with a book's copies."""
+        if is_available:
+            self.available_book_ids[book_id] = None
+        else:
+            self.available_book_ids.pop(book_id, None)
     
     # Member Management
     def add_member(self, member_id: str, name: str, email: str, phone: str, 
@@ -83,6 +238,9 @@ class Library:
         
         member = Member(member_id, name, email, phone, membership_type)
         self.members[member_id] = member
+        self._email_index[member_id] = len(self._member_emails)
+        self._member_emails.append(email)
+        self._email_owners.append(member_id)
         self._log_transaction("ADD_MEMBER", f"Added member: {name}")
         return True
     
@@ -96,9 +254,20 @@ class Library:
             return False  # Can't remove member with borrowed books
         
         del self.members[member_id]
+        self._remove_member_email(member_id)
         self._log_transaction("REMOVE_MEMBER", f"Removed member: {member.name}")
         return True
     
+    def _remove_member_email(self, member_id: str):
+        """Drop a member's email from the bulk mail list in O(1)."""
+        pos = self._email_index.pop(member_id)
+        last_email = self._member_emails.pop()
+        last_owner = self._email_owners.pop()
+        if pos < len(self._member_emails):
+            self._member_emails[pos] = last_email
+            self._email_owners[pos] = last_owner
+            self._email_index[last_owner] = pos
+    
     def get_member(self, member_id: str) -> Optional[Member]:
         """Get a member by ID."""
         return self.members.get(member_id)
@@ -107,94 +276,112 @@ class Library:
         """Get all members."""
         return list(self.members.values())
     
+    def list_member_choices(self) -> List[Tuple[str, str]]:
+        """Get (member_id, name) tuples for selection lists."""
+        return [(member.member_id, member.name) for member in self.members.values()]
+    
     # Borrowing and Returning
     def borrow_book(self, member_id: str, book_id: str) -> bool:
         """Borrow a book to a member."""
-        member = self.get_member(member_id)
-        book = self.get_book(book_id)
+        member = self.members.get(member_id)
+        book = self.books.get(book_id)
         
-        if not member or not book:
+        # All preconditions are checked here, so the model-level guards are skipped
+        if (member is None or book is None
+                or len(member.borrowed_books) >= member.max_books
+                or book.available_copies == 0
+                or book_id in member.borrowed_books):
             return False
         
-        if not member.can_borrow():
+        # Book.borrow re-checks the copy count; another thread may have taken the last one
+        if not book.borrow(member_id):
             return False
-        
-        if not book.is_available():
-            return False
-        
-        # Process the borrowing
-        if book.borrow(member_id) and member.borrow_book(book_id):
-            self._log_transaction("BORROW", f"Member {member.name} borrowed {book.title}")
-            return True
-        
-        return False
+        if not member.borrowed_books:
+            self.active_member_count += 1
+        member.borrowed_books.add(book_id)
+        self.total_available_copies -= 1
+        borrow_date = book.borrowed_by[member_id]
+        self._add_active_loan(book_id, member_id, borrow_date)
+        self.transactions.append((borrow_date, "BORROW", f"Member {member.name} borrowed {book.title}"))
+        return True
     
     def return_book(self, member_id: str, book_id: str) -> bool:
         """Return a book from a member."""
-        member = self.get_member(member_id)
-        book = self.get_book(book_id)
+        member = self.members.get(member_id)
+        book = self.books.get(book_id)
         
-        if not member or not book:
+        if member is None or book is None or book_id not in member.borrowed_books:
             return False
         
-        if book_id not in member.borrowed_books:
+        if not book.return_book(member_id):
             return False
-        
-        # Process the return
-        if book.return_book(member_id) and member.return_book(book_id):
-            self._log_transaction("RETURN", f"Member {member.name} returned {book.title}")
-            return True
-        
-        return False
+        member.return_book(book_id)
+        self.total_available_copies += 1
+        if not member.borrowed_books:
+            self.active_member_count -= 1
+        self._remove_active_loan(book_id, member_id)
+        self.transactions.append((datetime.now(), "RETURN", f"Member {member.name} returned {book.title}"))
+        return True
     
     # Reporting and Statistics
     def get_overdue_books(self, days: int = 14) -> List[Dict]:
         """Get list of overdue books."""
         overdue = []
-        cutoff_date = datetime.now() - timedelta(days=days)
+        now = datetime.now()
+        cutoff_date = now - timedelta(days=days)
         
-        for book in self.books.values():
-            for member_id, borrow_date in book.borrowed_by.items():
-                if borrow_date < cutoff_date:
-                    member = self.get_member(member_id)
-                    overdue.append({
-                        'book': book,
-                        'member': member,
-                        'borrow_date': borrow_date,
-                        'days_overdue': (datetime.now() - borrow_date).days
-                    })
+        # Loans are sorted by borrow date, so everything before the cutoff is overdue
+        end = bisect.bisect_left(self._active_loans, (cutoff_date,))
+        for borrow_date, book_id, member_id in self._active_loans[:end]:
+            overdue.append({
+                'book': self.books[book_id],
+                'member': self.get_member(member_id),
+                'borrow_date': borrow_date,
+                'days_overdue': (now - borrow_date).days
+            })
         
         return overdue
     
+    def _add_active_loan(self, book_id: str, member_id: str, borrow_date: datetime):
+        """Record an outstanding loan in the borrow-date index."""
+        # Book.borrowed_by keeps one date per member, so mirror a re-borrow as a replacement
+        self._remove_active_loan(book_id, member_id)
+        self._loan_pos[(book_id, member_id)] = borrow_date
+        bisect.insort(self._active_loans, (borrow_date, book_id, member_id))
+    
+    def _remove_active_loan(self, book_id: str, member_id: str):
+        """Drop a loan from the borrow-date index, if present."""
+        borrow_date = self._loan_pos.pop((book_id, member_id), None)
+        if borrow_date is None:
+            return
+        loan = (borrow_date, book_id, member_id)
+        index = bisect.bisect_left(self._active_loans, loan)
+        if index < len(self._active_loans) and self._active_loans[index] == loan:
+            del self._active_loans[index]
+    
     def get_library_stats(self) -> Dict:
         """Get library statistics."""
-        total_books = len(self.books)
-        total_copies = sum(book.total_copies for book in self.books.values())
-        available_copies = sum(book.available_copies for book in self.books.values())
-        borrowed_copies = total_copies - available_copies
-        total_members = len(self.members)
-        active_members = len([m for m in self.members.values() if m.borrowed_books])
-        
         return {
-            'total_books': total_books,
-            'total_copies': total_copies,
-            'available_copies': available_copies,
-            'borrowed_copies': borrowed_copies,
-            'total_members': total_members,
-            'active_members': active_members
+            'total_books': len(self.books),
+            'total_copies': self.total_copies,
+            'available_copies': self.total_available_copies,
+            'borrowed_copies': self.total_copies - self.total_available_copies,
+            'total_members': len(self.members),
+            'active_members': self.active_member_count
         }
     
     def _log_transaction(self, action: str, description: str):
         """Log a transaction."""
-        self.transactions.append({
-            'timestamp': datetime.now(),
-            'action': action,
-            'description': description
-        })
+        self.transactions.append((datetime.now(), action, description))
     
-    def get_transaction_history(self, limit: int = 50) -> List[Dict]:
+    def get_transaction_history(self, limit: int = 50) -> List[Transaction]:
         """Get recent transaction history."""
-        return self.transactions[-limit:] if limit else self.transactions
+        if not limit:
+            return list(map(Transaction._make, self.transactions))
+        # Walk back from the newest entry so only `limit` items are touched
+        recent = list(map(Transaction._make, islice(reversed(self.transactions), limit)))
+        recent.reverse()
+        return recent
     
     # Notification Management
     def setup_notifications(self, smtp_server: str, smtp_port: int, 
@@ -228,8 +415,7 @@ class Library:
         if not self.notification_service:
             return 0
         
-        member_emails = [member.email for member in self.members.values()]
-        return self.notification_service.send_bulk_emails(member_emails, subject, message)
+        return self.notification_service.send_bulk_emails(self._member_emails, subject, message)
     
     # Attendance and Visitor Management
     def check_in_member(self, member_id: str) -> bool:
@@ -266,6 +452,10 @@ class Library:
         """Get attendance statistics for a specific date."""
         return self.attendance_tracker.get_daily_stats(target_date)
     
+    def get_attendance_stats_for_dates(self, dates: List[date]) -> Dict[date, Dict]:
+        """Get attendance statistics for several dates at once."""
+        return self.attendance_tracker.get_stats_for_dates(dates)
+    
     def get_visitor_history(self, visitor_id: str):
         """Get attendance history for a specific visitor."""
         return self.attendance_tracker.get_visitor_history(visitor_id)
@@ -1,9 +1,12 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Set
 
 class Member:
     """Represents a library member."""
     
+    __slots__ = ('member_id', 'name', 'email', 'phone', 'membership_type', 'join_date',
+                 'borrowed_books', 'borrowing_history', 'max_books')
+    
     def __init__(self, member_id: str, name: str, email: str, phone: str, 
                  membership_type: str = "Regular"):
         self.member_id = member_id
@@ -12,7 +15,7 @@ class Member:
         self.phone = phone
         self.membership_type = membership_type
         self.join_date = datetime.now()
-        self.borrowed_books = []  # List of book_ids
+        self.borrowed_books: Set[str] = set()  # Set of book_ids
         self.borrowing_history = []  # List of (book_id, borrow_date, return_date)
         self.max_books = 5 if membership_type == "Premium" else 3
     
@@ -23,22 +26,23 @@ class Member:
     def borrow_book(self, book_id: str) -> bool:
         """Add a book to member's borrowed list."""
         if self.can_borrow():
-            self.borrowed_books.append(book_id)
+            self.borrowed_books.add(book_id)
             return True
         return False
     
     def return_book(self, book_id: str) -> bool:
         """Remove a book from member's borrowed list."""
         if book_id in self.borrowed_books:
-            self.borrowed_books.remove(book_id)
+            self.borrowed_books.discard(book_id)
             # Add to history
-            self.borrowing_history.append((book_id, datetime.now(), datetime.now()))
+            now = datetime.now()
+            self.borrowing_history.append((book_id, now, now))
             return True
         return False
     
     def get_borrowed_books(self) -> List[str]:
         """Get list of currently borrowed book IDs."""
-        return self.borrowed_books.copy()
+        return list(self.borrowed_books)
     
     def get_borrowing_history(self) -> List[tuple]:
         """Get borrowing history."""
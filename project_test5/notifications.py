@@ -1,6 +1,20 @@
 import smtplib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from email.mime.text import MIMEText
-from typing import List
+from typing import List, Tuple
+
+BULK_SEND_WORKERS = 4  # SMTP connections used in parallel for bulk sends
+
+# Bound str.format methods, so each reminder is a single call on a prebuilt template
+_OVERDUE_SUBJECT = "Overdue Book Reminder: {title}".format
+_OVERDUE_BODY = """Dear {name},
+
+This is a reminder that the book '{title}' is {days} days overdue. 
+Please return it as soon as possible.
+
+Thank you,
+Community Library""".format
 
 class NotificationService:
     """Handles sending email notifications."""
@@ -13,17 +27,28 @@ class NotificationService:
         self.smtp_password = smtp_password
         self.sender_email = sender_email
     
+    def _build_message(self, recipient_email: str, subject: str, body: str) -> MIMEText:
+        """Build a message ready to send."""
+        msg = MIMEText(body)
+        msg['Subject'] = subject
+        msg['From'] = self.sender_email
+        msg['To'] = recipient_email
+        return msg
+    
+    @contextmanager
+    def _smtp_session(self):
+        """Yield a logged-in SMTP connection, closed when the block exits."""
+        with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            server.starttls()
+            server.login(self.smtp_user, self.smtp_password)
+            yield server
+    
     def send_email(self, recipient_email: str, subject: str, body: str) -> bool:
         """Send a single email."""
         try:
-            msg = MIMEText(body)
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = recipient_email
+            msg = self._build_message(recipient_email, subject, body)
             
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
+            with self._smtp_session() as server:
                 server.sendmail(self.sender_email, [recipient_email], msg.as_string())
             
             return True
@@ -31,32 +56,45 @@ class NotificationService:
             print(f"Failed to send email to {recipient_email}: {e}")
             return False
     
-    def send_bulk_emails(self, recipient_emails: List[str], subject: str, body: str) -> int:
-        """Send email to multiple recipients."""
+    def _send_batch(self, messages: List[Tuple[str, str, str]]) -> int:
+        """Send (recipient, subject, body) messages over a single connection."""
         sent_count = 0
-        for email in recipient_emails:
-            if self.send_email(email, subject, body):
-                sent_count += 1
+        try:
+            with self._smtp_session() as server:
+                for recipient_email, subject, body in messages:
+                    try:
+                        msg = self._build_message(recipient_email, subject, body)
+                        server.sendmail(self.sender_email, [recipient_email], msg.as_string())
+                        sent_count += 1
+                    except Exception as e:
+                        print(f"Failed to send email to {recipient_email}: {e}")
+        except Exception as e:
+            print(f"SMTP session failed after sending {sent_count} of {len(messages)} emails: {e}")
         return sent_count
     
+    def _send_messages(self, messages: List[Tuple[str, str, str]]) -> int:
+        """Spread messages over a few connections, each logged in once."""
+        if not messages:
+            return 0
+        workers = min(BULK_SEND_WORKERS, len(messages))
+        batches = [messages[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(self._send_batch, batches))
+    
+    def send_bulk_emails(self, recipient_emails: List[str], subject: str, body: str) -> int:
+        """Send email to multiple recipients."""
+        return self._send_messages([(email, subject, body) for email in recipient_emails])
+    
     def send_overdue_reminders(self, overdue_books: List[dict]) -> int:
         """Send overdue reminders to members."""
-        sent_count = 0
+        messages = []
         for item in overdue_books:
             member = item['member']
-            book = item['book']
-            days_overdue = item['days_overdue']
-            
-            subject = f"Overdue Book Reminder: {book.title}"
-            body = f"""Dear {member.name},
-
-This is a reminder that the book '{book.title}' is {days_overdue} days overdue. 
-Please return it as soon as possible.
-
-Thank you,
-Community Library"""
-            
-            if self.send_email(member.email, subject, body):
-                sent_count += 1
+            title = item['book'].title
+            messages.append((
+                member.email,
+                _OVERDUE_SUBJECT(title=title),
+                _OVERDUE_BODY(name=member.name, title=title, days=item['days_overdue'])
+            ))
         
-        return sent_count
+        return self._send_messages(messages)
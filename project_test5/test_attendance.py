@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+# Point the app at a throwaway database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_db_dir, 'test.db'))
+
+from sqlalchemy import create_mock_engine
+from app import app
+from attendance import AttendanceRecord, AttendanceTracker, VisitorType
+
+
+class AttendanceCheckInTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.tracker = AttendanceTracker()
+    
+    def tearDown(self):
+        self.ctx.pop()
+    
+    def test_check_in_again_after_check_out(self):
+        self.assertTrue(self.tracker.check_in('V-repeat', 'Repeat Visitor', VisitorType.VISITOR))
+        self.assertFalse(self.tracker.check_in('V-repeat', 'Repeat Visitor', VisitorType.VISITOR))
+        self.assertTrue(self.tracker.check_out('V-repeat'))
+        self.assertTrue(self.tracker.check_in('V-repeat', 'Repeat Visitor', VisitorType.VISITOR))
+        self.assertTrue(self.tracker.is_currently_present('V-repeat'))
+    
+    def _index_ddl(self, url):
+        statements = []
+        engine = create_mock_engine(
+            url, lambda sql, *args, **kw: statements.append(str(sql.compile(dialect=engine.dialect)))
+        )
+        AttendanceRecord.__table__.create(engine, checkfirst=False)
+        return [s for s in statements if 'ix_attendance_active' in s]
+    
+    def test_unique_active_index_only_where_partial(self):
+        self.assertIn('WHERE', self._index_ddl('sqlite://')[0])
+        self.assertEqual(self._index_ddl('mysql://'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+# Point the app at a throwaway database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+
+from app import app, limiter
+
+
+class LoginRateLimitTest(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        limiter.reset()
+        self.client = app.test_client()
+    
+    def _login(self, remote_addr, username, password='wrong'):
+        return self.client.post('/login', data={'username': username, 'password': password},
+                                environ_base={'REMOTE_ADDR': remote_addr})
+    
+    def test_username_attempts_do_not_use_up_ip_limit(self):
+        # Five failures for a username that looks like an IP, sent from another address
+        for _ in range(5):
+            self.assertNotEqual(self._login('1.2.3.4', '10.9.9.9').status_code, 429)
+        
+        response = self._login('10.9.9.9', 'admin', 'admin123')
+        self.assertEqual(response.status_code, 302)
+    
+    def test_username_equal_to_own_ip_is_counted_once(self):
+        for _ in range(5):
+            self.assertNotEqual(self._login('10.0.0.1', '10.0.0.1').status_code, 429)
+        self.assertEqual(self._login('10.0.0.1', '10.0.0.1').status_code, 429)
+    
+    def test_username_limit_applies_across_ips(self):
+        for i in range(5):
+            self.assertNotEqual(self._login(f'10.1.0.{i}', 'admin').status_code, 429)
+        self.assertEqual(self._login('10.1.0.9', 'admin').status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,24 +1,54 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 
 # This db object will be initialized in app.py
 # db = SQLAlchemy(app)
 db = SQLAlchemy()
 
+# argon2id with the library's default cost; hashes fit comfortably in password_hash
+_password_hasher = PasswordHasher()
+
+def hash_password(password: str) -> str:
+    """Hash a password with argon2id."""
+    return _password_hasher.hash(password)
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """Check a password against an argon2 or legacy Werkzeug hash."""
+    if not password_hash.startswith('$argon2'):
+        return check_password_hash(password_hash, password)
+    try:
+        return _password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(password_hash: str) -> bool:
+    """Check if a hash is a legacy format or uses outdated argon2 parameters."""
+    return not password_hash.startswith('$argon2') or _password_hasher.check_needs_rehash(password_hash)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
-    role = db.Column(db.String(20), nullable=False, default='user')  # 'admin', 'user', or 'student'
+    role = db.Column(db.String(20), nullable=False, default='user', index=True)  # 'admin', 'user', or 'student'
     student_id = db.Column(db.String(30), unique=True, nullable=True)  # Only for students
     department = db.Column(db.String(80), nullable=True)  # Only for students
     year = db.Column(db.String(10), nullable=True)  # Only for students
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify the password, upgrading an outdated hash in place on success."""
+        if not verify_password(self.password_hash, password):
+            return False
+        if password_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
     def is_admin(self):
         return self.role == 'admin'
@@ -26,11 +56,32 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Set once an admin is known to exist, so repeated calls in this process skip the query
+_ADMIN_BOOTSTRAPPED = False
+
 def create_initial_admin(db):
     """Create an initial admin user if none exists."""
-    if not User.query.filter_by(role='admin').first():
+    global _ADMIN_BOOTSTRAPPED
+    if _ADMIN_BOOTSTRAPPED:
+        return
+    if db.session.query(User.id).filter_by(role='admin').first() is None:
         admin = User(username='admin', role='admin')
         admin.set_password('admin123')  # Change this after first login!
         db.session.add(admin)
         db.session.commit()
-        print('Initial admin user created: admin / admin123') 
\ No newline at end of file
+        print('Initial admin user created: admin / admin123')
+    _ADMIN_BOOTSTRAPPED = True
+
+# A few argon2 hashes finish quickly enough on their own; a pool only pays off for real imports
+PARALLEL_HASH_THRESHOLD = 4
+# Each argon2id hash holds memory_cost (64 MiB by default) and already runs its own
+# lanes in parallel, so only a couple of hashes run at once. Threads rather than
+# processes, so a request handler never forks the web process.
+HASH_WORKERS = min(2, os.cpu_count() or 1)
+
+def hash_many(passwords: List[str]) -> List[str]:
+    """Hash several passwords on a few threads for bulk imports."""
+    if len(passwords) < PARALLEL_HASH_THRESHOLD or HASH_WORKERS == 1:
+        return [hash_password(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        return list(executor.map(hash_password, passwords))